@@ -7,15 +7,16 @@ import logging
 def load_citations(fn):
     db = defaultdict(OrderedDict)
     docid = None
-    for i, line in enumerate(open(fn)):
+    with open(fn, encoding='utf-8') as f:
+        lines = f.read().split('\n')
+    for i, line in enumerate(lines):
         line = line.strip()
         if not line:
             docid = None
         elif line.startswith('doc_id'):
-            _, docid = line.split('=')
-            docid = docid.strip()
+            docid = line.partition('=')[2].strip()
         elif docid is None:
-            logging.warning('Property at line {} has no doc-id'.format(i+1))
+            logging.warning('Property at line %d has no doc-id', i+1)
         else:
             key, val = line.split(':', 1)
             db[docid][key.strip()] = val.strip()
@@ -24,14 +25,14 @@ def load_citations(fn):
 
 def load_update_tsv(fn):
     db = defaultdict(OrderedDict)
-    with open(fn) as f:
+    with open(fn, encoding='utf-8', buffering=1<<16) as f:
         fields = next(f).split()
         for i, line in enumerate(f):
             toks = line.split('\t')
             docid = toks[0].strip()
             if not docid:
                 logging.warning(
-                    'Update line {} is missing a doc-id.'.format(i+2)
+                    'Update line %d is missing a doc-id.', i+2
                 )
             for key, val in zip(fields[1:], toks[1:]):
                 db[docid][key.strip()] = val.strip()
@@ -40,11 +41,12 @@ def load_update_tsv(fn):
 
 def update(db, newvals, add=False):
     for docid, d in newvals.items():
-        if docid not in db and add == False:
-            continue
-        else:
-            for key, val in d.items():
-                db[docid][key] = val
+        target = db.get(docid)
+        if target is None:
+            if not add:
+                continue
+            target = db[docid]
+        target.update(d)
 
 
 def print_citations(db):
@@ -5,7 +5,7 @@ from __future__ import print_function
 import sys
 import argparse
 import logging
-from collections import OrderedDict
+import unicodedata
 
 from xigt.codecs import xigtxml
 from xigt import Tier
@@ -25,13 +25,11 @@ def clean_corpus(xc):
                     clean_tier = tier
         if raw_tier is None:
             logging.info(
-                'No raw tier found for cleaning for IGT with id: {}'
-                .format(str(igt.id))
+                'No raw tier found for cleaning for IGT with id: %s', igt.id
             )
         elif clean_tier is not None:
             logging.warning(
-                'Cleaned tier already found for IGT with id: {}'
-                .format(str(igt.id))
+                'Cleaned tier already found for IGT with id: %s', igt.id
             )
         else:
             add_cleaned_tier(igt, raw_tier)
@@ -46,8 +44,8 @@ def add_cleaned_tier(igt, raw_tier):
             break
     if clean_id is None:
         logging.warning(
-            'No preset ID for cleaned tier was available for IGT with id: {}'
-            .format(str(igt.id))
+            'No preset ID for cleaned tier was available for IGT with id: %s',
+            igt.id
         )
     else:
         cleaned_items = clean_items(raw_tier, clean_id)
@@ -93,6 +91,13 @@ def merge_diacritics(items):
         if line.strip() == '':
             newitems.append(item)
             continue
+        if line.isascii():
+            # no diacritics to merge, but drop a final space like the
+            # space-removal step below does
+            if line.endswith(' '):
+                item.text = line[:-1]
+            newitems.append(item)
+            continue
         line = unicodedata.normalize('NFKD', line)
         # first remove inserted spaces before diacritics
         max_j = len(line) - 1
@@ -150,22 +155,29 @@ def merge_lines(items):
         # lines are pairs of attributes and content
         prev = newitems[-1]
         cur = items[i]
-        p_tags = get_tags(prev)
-        c_tags = get_tags(cur)
+        c_attrs = cur.attributes
+        c_tag_str = c_attrs.get('tag', '')
+        # most lines aren't corrupted, so don't bother splitting tags
+        if 'CR' not in c_tag_str:
+            newitems.append(cur)
+            continue
+        p_attrs = prev.attributes
+        p_tags = p_attrs.get('tag', '').split('+')
+        c_tags = c_tag_str.split('+')
         # if no non-CR tags are shared
         if 'CR' not in c_tags or \
-           len(set(p_tags).intersection(c_tags).difference(['CR'])) == 0:
+           not set(p_tags).intersection(c_tags).difference(['CR']):
             newitems.append(cur)
             continue
         merged = bit_merge(prev.text or '', cur.text or '')
         if merged is not None:
-            # there's no OrderedSet, but OrderedDict will do
-            tags = OrderedDict((t,1) for t in p_tags + c_tags)
+            # there's no OrderedSet, but dict keys keep insertion order
+            tags = dict.fromkeys(p_tags + c_tags)
             del tags['CR']  # assume we fixed the problem?
-            line_nums = ' '.join([prev.attributes.get('line'),
-                                  cur.attributes.get('line')])
-            prev.attributes['tag'] = '+'.join(tags)
-            prev.attributes['line'] = line_nums
+            line_nums = ' '.join([p_attrs.get('line'),
+                                  c_attrs.get('line')])
+            p_attrs['tag'] = '+'.join(tags)
+            p_attrs['line'] = line_nums
             prev.text = merged
     return newitems
 
@@ -185,11 +197,16 @@ def merge_strings(a, b):
     return ''.join(m).rstrip(' ')
 
 
+# maps null bytes to 0 and all other bytes to 1
+_nonnull_mask = bytes([0] + [1] * 255)
+
+
 def bit_merge(a, b):
     """
     Merge two strings on whitespace by converting whitespace to the
-    null character, then AND'ing the bit strings of a and b, then
-    convert back to regular strings (with spaces).
+    null character, then OR'ing the bit strings of a and b (as long
+    as no two non-null bytes overlap), then convert back to regular
+    strings (with spaces).
     """
     if len(b) > len(a): return bit_merge(b, a)
     try:
@@ -197,18 +214,17 @@ def bit_merge(a, b):
         # make sure the strings are the same length
         a = a.replace(' ','\0').encode('utf-8')
         b = b.replace(' ','\0').encode('utf-8').ljust(len(a), b'\0')
-        c_pairs = zip(a, b)
+        b = b[:len(a)]
     except UnicodeDecodeError:
         return None
-    c = []
-    for c1, c2 in c_pairs:
-        # only merge if they merge cleanly
-        if c1 != 0 and c2 != 0:
-            return None
-        else:
-            c.append(c1|c2)
+    # only merge if they merge cleanly
+    if (int.from_bytes(a.translate(_nonnull_mask), 'big') &
+            int.from_bytes(b.translate(_nonnull_mask), 'big')):
+        return None
+    c = int.from_bytes(a, 'big') | int.from_bytes(b, 'big')
     try:
-        return bytes(c).decode('utf-8').replace('\0',' ').rstrip(' ')
+        c = c.to_bytes(len(a), 'big')
+        return c.decode('utf-8').replace('\0',' ').rstrip(' ')
     except UnicodeDecodeError:
         return None
 
@@ -242,7 +258,7 @@ def main(arglist=None):
 def run(args):
     if args.infiles:
         for fn in args.infiles:
-            logging.info('Cleaning {}'.format(fn))
+            logging.info('Cleaning %s', fn)
             xc = xigtxml.load(fn, mode='full')
             clean_corpus(xc)
             xigtxml.dump(fn, xc)
@@ -6,26 +6,24 @@ import sys
 import re
 import argparse
 import logging
-try:
-    from itertools import izip_longest as zip_longest  # py2
-except ImportError:
-    from itertools import zip_longest  # py3
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import chain
 
 from xigt.codecs import xigtxml
-from xigt import Item, Tier, xigtpath as xp
+from xigt import XigtCorpus, Item, Tier, xigtpath as xp
 
 from odinxigt import (
     copy_items,
     get_tags,
-    remove_blank_items,
-    min_indent,
+    first_tag,
     shift_left
 )
 
 
 BLANK_TAG = 'B'
-LANG_CODE_PATH = 'metadata//dc:subject/@olac:code'
-LANG_NAME_PATH = 'metadata//dc:subject/text()'
+# the language code is the olac:code attribute; the name is the text
+LANG_SUBJECT_PATH = 'metadata//dc:subject'
 
 # quote list: https://en.wikipedia.org/wiki/Quotation_mark
 QUOTES = (
@@ -90,34 +88,49 @@ QUOTEPAIRS = {
     '\uff62': ['\uff63']  # halfwidth left/right corner bracket
 }
 OPENQUOTES = ''.join(QUOTEPAIRS.keys())
-CLOSEQUOTES = ''.join(q for qs in QUOTEPAIRS.values() for q in qs)
+# several open quotes share closing quotes; keep each one only once
+CLOSEQUOTES = ''.join(
+    dict.fromkeys(q for qs in QUOTEPAIRS.values() for q in qs)
+)
+# for testing single characters without a regex
+OPENQUOTE_SET = frozenset(OPENQUOTES)
+CLOSEQUOTE_SET = frozenset(CLOSEQUOTES)
 
 def normalize_corpus(xc):
     for igt in xc:
-        base_tier = None
-        norm_tier = None
-        for tier in igt:
-            if tier.type == 'odin':
-                state = tier.attributes.get('state')
-                # don't get raw tier if cleaned exists
-                if base_tier is None and state == 'raw':
-                    base_tier = tier
-                elif state == 'cleaned':
-                    base_tier = tier
-                elif state == 'normalized':
-                    norm_tier = tier
-        if base_tier is None:
-            logging.info(
-                'No cleaned tier found for normalizing for IGT with id: {}'
-                .format(str(igt.id))
-            )
-        elif norm_tier is not None:
-            logging.warning(
-                'Normalized tier already found for IGT with id: {}'
-                .format(str(igt.id))
-            )
-        else:
-            add_normalized_tier(igt, base_tier)
+        normalize_igt(igt)
+
+
+def iter_normalized_igts(xc):
+    for igt in xc:
+        normalize_igt(igt)
+        yield igt
+
+
+def normalize_igt(igt):
+    base_tier = None
+    norm_tier = None
+    for tier in igt:
+        if tier.type == 'odin':
+            state = tier.attributes.get('state')
+            # don't get raw tier if cleaned exists
+            if base_tier is None and state == 'raw':
+                base_tier = tier
+            elif state == 'cleaned':
+                base_tier = tier
+            elif state == 'normalized':
+                norm_tier = tier
+    if base_tier is None:
+        logging.info(
+            'No cleaned tier found for normalizing for IGT with id: %s',
+            igt.id
+        )
+    elif norm_tier is not None:
+        logging.warning(
+            'Normalized tier already found for IGT with id: %s', igt.id
+        )
+    else:
+        add_normalized_tier(igt, base_tier)
 
 
 def add_normalized_tier(igt, base_tier):
@@ -130,8 +143,7 @@ def add_normalized_tier(igt, base_tier):
     if norm_id is None:
         logging.warning(
             'No preset ID for normalized tier was available '
-            'for IGT with id: {}'
-            .format(str(igt.id))
+            'for IGT with id: %s', igt.id
         )
     else:
         norm_items = normalize_items(base_tier, norm_id)
@@ -148,15 +160,19 @@ def add_normalized_tier(igt, base_tier):
 def normalize_items(base_tier, norm_id):
     # first make copies of the original items
     items = copy_items(base_tier.items)
-    items = remove_blank_items(items)  # don't bother with blank lines
-    items = rejoin_continuations(items)
-    items = rejoin_translations(items)
+    # the first few steps are chained so they share a single pass over
+    # the items instead of each building a new list
+    items = (i for i in items if (i.text or '').strip() != '')  # no blanks
+    items = rejoin_translations(iter_rejoined_continuations(items))
     items = remove_citations(items)
     items = remove_language_name(items, base_tier.igt)
     items = remove_example_numbers(items)
-    items = remove_blank_items(items)  # in case previous created blanks
 
+    normalized = []
     for item in items:
+        if (item.text or '').strip() == '':
+            continue  # in case previous steps created blanks
+        normalized.append(item)
         # and set the copy's alignments to their current ID (changed later)
         item.alignment = item.id
         rejoin_hyphenated_grams(item)
@@ -167,6 +183,7 @@ def normalize_items(base_tier, norm_id):
         if tags[0] == 'B':
             tags = ['M'] + tags[1:]
             item.attributes['tag'] = '+'.join(tags)
+    items = normalized
 
     items = separate_secondary_translations(items)
     items = dewrap_lines(items)
@@ -178,14 +195,29 @@ def normalize_items(base_tier, norm_id):
 
     return items
 
-def whitespace(m):
-    start, end = m.span()
-    return ' ' * (end - start)
-
 def merge_items(*items):
-    alignment = ','.join(i.alignment for i in items if i.alignment)
-    content = ','.join(i.content for i in items if i.content)
-    segmentation = ','.join(i.segmentation for i in items if i.segmentation)
+    # gather everything in one pass over the items
+    alignments, contents, segmentations = [], [], []
+    texts, lines = [], []
+    pri_tags = set()
+    sec_tags = set()
+    for item in items:
+        alignment = item.alignment
+        if alignment: alignments.append(alignment)
+        content = item.content
+        if content: contents.append(content)
+        segmentation = item.segmentation
+        if segmentation: segmentations.append(segmentation)
+        texts.append(item.text)
+        lines.append(item.attributes['line'])
+        tags = get_tags(item)
+        if tags[0]:
+            pri_tags.add(tags[0])
+        sec_tags.update(tags[1:])
+
+    alignment = ','.join(alignments)
+    content = ','.join(contents)
+    segmentation = ','.join(segmentations)
 
     if segmentation and (alignment or content):
         raise ValueError(
@@ -195,20 +227,13 @@ def merge_items(*items):
 
     base = items[0]
 
-    base.text = ' '.join(i.text for i in items)
+    base.text = ' '.join(texts)
 
-    base.attributes['line'] = ' '.join(i.attributes['line'] for i in items)
+    base.attributes['line'] = ' '.join(lines)
     if alignment: base.alignment = alignment
     if content: base.content = content
     if segmentation: base.segmentation = segmentation
 
-    pri_tags = set()
-    sec_tags = set()
-    for item in items:
-        tags = get_tags(item)
-        if tags[0]:
-            pri_tags.add(tags[0])
-        sec_tags.update(tags[1:])
     tag = '-'.join(sorted(pri_tags)).replace('G-L', 'L-G')
     if sec_tags:
         tag = '{}+{}'.format(tag, '+'.join(sorted(sec_tags)))
@@ -216,17 +241,35 @@ def merge_items(*items):
 
 
 def rejoin_continuations(items):
-    new_items = []
+    return list(iter_rejoined_continuations(items))
+
+
+def iter_rejoined_continuations(items):
+    # an item is only yielded once all of its continuation lines are
+    # merged into it, so later steps can consume this lazily
+    prev = None
     for item in items:
         tags = get_tags(item)
-        if tags[0] == 'C' and new_items:
+        if tags[0] == 'C' and prev is not None:
             item.text = item.text.lstrip()
             item.attributes['tag'] = item.attributes['tag'][1:]  # remove C
-            merge_items(new_items[-1], item)
+            merge_items(prev, item)
         else:
-            new_items.append(item)
-    return new_items
+            if prev is not None:
+                yield prev
+            prev = item
+    if prev is not None:
+        yield prev
+
 
+marked_trans_re = re.compile(r'^\s*[(\[]?\s*\S+\s*\.?\s*[)\]]?\s*:', re.U)
+
+def ends_with_closequote(text):
+    # same test as re.search(r'[{cq}] *\)* *$'), i.e. a closing quote
+    # optionally followed by spaces, then parens, then spaces
+    if text.endswith('\n'):
+        text = text[:-1]  # $ also matches before a final newline
+    return text.rstrip(' ').rstrip(')').rstrip(' ')[-1:] in CLOSEQUOTE_SET
 
 def rejoin_translations(items):
     # rejoin translation lines if they don't start with some kind of
@@ -237,32 +280,47 @@ def rejoin_translations(items):
     for item in items:
         tags = get_tags(item)
         is_t = tags[0] == 'T' and 'DB' not in tags and 'CR' not in tags
-        marked = re.match(
-            r'^\s*[(\[]?\s*\S+\s*\.?\s*[)\]]?\s*:', item.text, re.U
-        )
+        marked = marked_trans_re.match(item.text)
         if prev_is_t and is_t and not marked and not prev_end:
             item.text = item.text.lstrip()
             merge_items(new_items[-1], item)
         else:
             new_items.append(item)
             prev_is_t = is_t
-        end_match = re.search(r'[{}] *\)* *$'.format(CLOSEQUOTES), item.text)
-        prev_end = end_match is not None
+        prev_end = ends_with_closequote(item.text)
     return new_items
 
 
+# Citation contents are anything up to two "(...)" groups, which can't
+# contain ")" themselves. These used to be written as
+#   [^\]]*(\([^)]*\))?[0-9]*[^\]]*(\([^)]*\))?
+# (and the same with ")" for parens), but the overlapping *-runs made
+# the regex backtrack cubically on lines with many brackets. The forms
+# below accept exactly the same strings but can only match them one way.
+# In [...], a "]" can only occur inside one of the groups:
+_cit_bracket_group = r'(?:[^\]]*\))?[^()\]]*\([^)\]]*\][^)]*\)'
+_cit_bracket_inner = (
+    r'[^\]]*'
+    r'|' + _cit_bracket_group + r'(?:[^\]]*|' + _cit_bracket_group + ')'
+)
+# In (...), each ")" must close a group opened since the previous one:
+_cit_paren_inner = r'[^()]*(?:\([^)]*(?:\)[^()]*(?:\([^)]*\)?)?)?)?'
 citation_re = re.compile(
     r'(\s{3}( [-a-zA-Z]+){1,4} ?|=?)'
     '('
-    r'\[(?P<inner1>([^\]]*(\([^\)]*\))?)[0-9]*([^\]]*(\([^)]*\))?))\]'
+    r'\[(?P<inner1>' + _cit_bracket_inner + r')\]'
     r'|'
-    r'\((?P<inner2>([^)]*(\([^)]*\))?)[0-9]*([^)]*(\([^)]*\))?))\)'
+    r'\((?P<inner2>' + _cit_paren_inner + r')\)'
     ')'
     r'\s*$',
     re.U
 )
 
 def remove_citations(items):
+    # primary tags don't change here; get them once for the lookups
+    first_tags = [first_tag(item) for item in items]
+    n = len(items)
+
     def removable(m, t, i):
         # citation matches are removable if they don't look like
         # translation alternates or bracketed glosses
@@ -270,18 +328,21 @@ def remove_citations(items):
             start, end = m.span()
             other = None
             if t == 'L':  # look down then up for nearest G
-                others = items[i+1:] + items[i-1::-1]
+                others = chain(range(i+1, n), range(i-1, -1, -1))
                 t2 = 'G'
             else:  # look up then down for nearest L
-                others = items[i-1:] + items[i-1::-1]
+                others = chain(range(max(i-1, 0), n), range(i-1, -1, -1))
                 t2 = 'L'
-            other = next((i for i in others if get_tags(i)[0] == t2), None)
+            other = next((items[j] for j in others if first_tags[j] == t2),
+                         None)
             if other and (other.text or '')[start:end].strip() != '':
                 return False
-        elif re.match(r'\s*[{}].*[{}]\s*$'.format(OPENQUOTES, CLOSEQUOTES),
-                      m.group('inner1') or m.group('inner2'),
-                      re.U):
-            return False
+        else:
+            # quoted contents (on one line) are probably translations
+            inner = (m.group('inner1') or m.group('inner2') or '').strip()
+            if (len(inner) > 1 and inner[0] in OPENQUOTE_SET
+                    and inner[-1] in CLOSEQUOTE_SET and '\n' not in inner):
+                return False
         return True
 
     new_items = []
@@ -290,13 +351,18 @@ def remove_citations(items):
         tags = get_tags(item)
         if tags[0] not in ('L', 'G', 'T', 'L-G', 'L-T', 'L-G-T'):
             continue
+        # citation_re needs a closing bracket before trailing spaces
+        if not item.text.rstrip().endswith((']', ')')):
+            continue
         match = citation_re.search(item.text)
         if (match and removable(match, tags[0], i)):
             meta_item = Item(id=item.id,
                              text=match.group(0).strip(),
                              attributes=item.attributes)
             m_tags = ['M']
-            item.text = citation_re.sub('', item.text).rstrip()
+            # citation_re is anchored at the end, so sub() would only
+            # remove the span we already matched
+            item.text = item.text[:match.start()].rstrip()
             if 'AC' in tags:
                 tags.remove('AC')
                 m_tags.append('AC')
@@ -313,10 +379,26 @@ def remove_citations(items):
     return new_items
 
 
+lgname_sep_re = re.compile(r'[- ]+', re.U)
+lgname_prefix_re = re.compile(r'\w{3}', re.U)
+
+@lru_cache(maxsize=512)
+def _language_name_res(sig):
+    # most IGTs in a corpus share a language, so reuse the patterns
+    start_lg_re = re.compile(r'^\s*[(\[]?({})[)\]]?'.format(sig), re.U)
+    end_lg_re = re.compile(r'[(\[]?({})[)\]]?\s*$'.format(sig), re.U)
+    return start_lg_re, end_lg_re
+
+
 def remove_language_name(items, igt):
     new_items = []
-    lgcode = xp.find(igt, LANG_CODE_PATH)
-    lgname = xp.find(igt, LANG_NAME_PATH)
+    # find the subject once and read both values off it, rather than
+    # walking the metadata twice
+    lgcode = lgname = None
+    subject = xp.find(igt, LANG_SUBJECT_PATH)
+    if subject is not None:
+        lgcode = subject.get_attribute('code', namespace='olac')
+        lgname = subject.text
     lgtoks = []
     if lgcode and '?' not in lgcode and '*' not in lgcode:
         codes = set(lgcode.split(':'))  # split up complex codes
@@ -326,38 +408,51 @@ def remove_language_name(items, igt):
     if lgname and '?' not in lgname:
         lgtoks.append(lgname)
         lgtoks.append(lgname.upper())
-        if re.search('[- ]', lgname, re.U):  # abbreviation for multiword names
+        if lgname_sep_re.search(lgname):  # abbreviation for multiword names
             lgtoks.append(''.join(ln[0]
-                          for ln in re.split(r'[- ]+', lgname, re.U)))
-        if re.search(r'^\w{3}', lgname, re.U):
+                          for ln in lgname_sep_re.split(lgname)))
+        if lgname_prefix_re.match(lgname):
             lgtoks.append(lgname[:3])
     if lgtoks:
+        # alternation takes the first token that matches, not the
+        # longest, so try longer tokens first (sorting also gives the
+        # same pattern, and cache key, regardless of set order)
+        lgtoks.sort(key=lambda t: (-len(t), t))
         sig = '|'.join(re.escape(t) for t in lgtoks)
-        start_lg_re = re.compile(r'^\s*[(\[]?({})[)\]]?'
-                                 .format(sig), re.U)
-        end_lg_re = re.compile(r'[(\[]?({})[)\]]?\s*$'
-                               .format(sig), re.U)
+        start_lg_re, end_lg_re = _language_name_res(sig)
+        # the regexes can only match if the (stripped) text starts or
+        # ends with a token, optionally bracketed; check that first
+        prefixes = tuple(p + t for p in ('', '(', '[') for t in lgtoks)
+        suffixes = tuple(t + s for s in ('', ')', ']') for t in lgtoks)
+        # Item() copies the attributes dict, so the meta items below can
+        # be given item.attributes directly and then retagged
         for item in items:
             new_items.append(item)  # add now; might be modified later
             tags = get_tags(item)
             if tags[0] != 'M':
                 orig = item.text
-                m = start_lg_re.match(item.text)
+                m = None
+                if item.text.lstrip().startswith(prefixes):
+                    m = start_lg_re.match(item.text)
                 if m:
                     meta_item = Item(id=item.id,
                                      text=m.group(0).strip(),
-                                     attributes=dict(item.attributes))
+                                     attributes=item.attributes)
                     meta_item.attributes['tag'] = 'M+LN'
                     new_items.append(meta_item)
-                    item.text = start_lg_re.sub(whitespace, item.text)
-                m = end_lg_re.search(item.text)
+                    item.text = ' ' * m.end() + item.text[m.end():]
+                m = None
+                if item.text.rstrip().endswith(suffixes):
+                    m = end_lg_re.search(item.text)
                 if m:
                     meta_item = Item(id=item.id,
                                      text=m.group(0).strip(),
-                                     attributes=dict(item.attributes))
+                                     attributes=item.attributes)
                     meta_item.attributes['tag'] = 'M+LN'
-                    items.append(meta_item)
-                    item.text = end_lg_re.sub(whitespace, item.text).rstrip()
+                    new_items.append(meta_item)
+                    # the match runs to the end, so blanking it out and
+                    # right-stripping just leaves what came before it
+                    item.text = item.text[:m.start()].rstrip()
                 if 'LN' in tags and item.text != orig:
                     tags.remove('LN')
                     item.attributes['tag'] = '+'.join(tags)
@@ -382,27 +477,34 @@ ex_num_re = re.compile(
 
 def remove_example_numbers(items):
     # IGT-initial numbers (e.g. '1.' '(1)', '5a.', '(ii)')
+    # tags don't change here, so find the lines to compare against once
+    content_items = [
+        item for item in items
+        if first_tag(item) in ('L', 'G', 'T', 'L-G', 'G-T', 'L-T', 'L-G-T')
+    ]
+
     def removable(m):
         start, end = m.span()
         end -= 1 # ignore the required final space
         mtext = m.group('exnum')
-        for item in items:
-            tags = get_tags(item)
-            if tags[0] not in ('L', 'G', 'T', 'L-G', 'G-T', 'L-T', 'L-G-T'):
-                continue
+        for item in content_items:
             text = (item.text or '')[start:end]
             if text != mtext and text.strip() != '':
                 return False
         return True
 
+    # ex_num_re is anchored, so blank out the matched span directly
+    # instead of re-running the regex through re.sub
     for item in items:
         tags = get_tags(item)
         if tags[0] in ('L-G', 'L-T', 'G-T', 'L-G-T'):
-            item.text = ex_num_re.sub(whitespace, item.text)
+            m = ex_num_re.match(item.text)
+            if m:
+                item.text = ' ' * m.end() + item.text[m.end():]
         elif tags[0] in ('L', 'G', 'T'):
             m = ex_num_re.match(item.text)
             while m and removable(m):
-                item.text = ex_num_re.sub(whitespace, item.text)
+                item.text = ' ' * m.end() + item.text[m.end():]
                 m = ex_num_re.match(item.text)
     return items
 
@@ -413,39 +515,48 @@ def remove_example_numbers(items):
 #     item.text = re.sub(r'^\s*\w+(\s\w+)?\s*:\s', '', item.text)
 
 
+# morpheme delimiters by primary tag
+hyphenated_gram_res = dict(
+    (tag, re.compile(r'(\S*(?:\s*[{}]\s*\S*)+)'.format(delims), re.U))
+    for tag, delims in (('L', '-='), ('L-G', '-='), ('G', '-=.'))
+)
+
+
 def rejoin_hyphenated_grams(item):
     # there may be morphemes separated by hyphens, but with intervening
     # spaces; slide the token over (e.g. "dog-  NOM" => "dog-NOM  ")
     tags = get_tags(item)
-    delims = {
-        'L': '-=',
-        'L-G': '-=',
-        'G': '-=.'
-    }
-    if tags[0] in delims:
-        pattern = r'(\S*(?:\s*[{}]\s*\S*)+)'.format(delims[tags[0]])
-        text = item.text
-        toks = []
-        pos = 0
-        for match in list(re.finditer(pattern, text, re.U)):
-            start, end = match.span()
-            toks.append(text[pos:start])
-            toks.append(text[start:end].replace(' ', ''))
-            pos = end
-        toks.append(text[pos:len(text)])
-        item.text = ''.join(toks).rstrip()
+    if tags[0] in hyphenated_gram_res:
+        hyphen_re = hyphenated_gram_res[tags[0]]
+        item.text = hyphen_re.sub(
+            lambda m: m.group(0).replace(' ', ''), item.text
+        ).rstrip()
 
 # judgment extraction adapted from code from Ryan Georgi (PC)
 # don't attempt for still-corrupted lines or those with alternations
 # (detected by looking for '/' in the string)
+judgment_re = re.compile(r'^(\s*)([*?#]+)\s*', re.U)
+
 def extract_judgment(item):
     tags = get_tags(item)
     if tags[0] == 'M' or 'CR' in tags:
         return
-    match = re.match(r'^\s*([*?#]+)[^/]+$', item.text, re.U)
+    text = item.text
+    stripped = text.lstrip()
+    if not stripped or stripped[0] not in '*?#':
+        return  # most lines have no judgment; skip the regex
+    match = judgment_re.match(text)
     if match:
-        item.attributes['judgment'] = match.group(1)
-    item.text = re.sub(r'^(\s*)[*?#]+\s*', r'\1', item.text, re.U)
+        judgment = match.group(2)
+        rest = text[match.end(2):]
+        if '/' not in rest:
+            if not rest:
+                # a judgment must be followed by something, so the last
+                # marker character counts as the content
+                judgment = judgment[:-1]
+            if judgment:
+                item.attributes['judgment'] = judgment
+        item.text = match.group(1) + text[match.end():]
 
 # BEWARE: regex magic below
 #  (?P<name>...) makes a named group
@@ -464,6 +575,14 @@ basic_quoted_trans_re = re.compile(
     re.I|re.U
 )
 
+# normalizes the space between adjacent quoted translations
+quote_sep_re = re.compile(
+    r'([{cq}])\s*(\s|/)\s*([{oq}])'.format(oq=OPENQUOTES, cq=CLOSEQUOTES),
+    re.U
+)
+alt_trans_re = re.compile(r'(or|also|ii+|\b[bcd]\.)[ :,]', re.U)
+word_char_re = re.compile(r'\w', re.U)  # \d is a subset of \w
+
 def separate_secondary_translations(items):
     # sometimes translation lines with secondary translations are marked
     # as +DB even if they are for the same, single IGT
@@ -472,18 +591,16 @@ def separate_secondary_translations(items):
         if tags[0] in ('L', 'G', 'L-G') and 'DB' in tags[1:]:
             # don't attempt
             return items
-    indent = min_indent(items, tags=('L','G','L-G','L-G-T','G-T'))
 
     new_items = []
     for item in items:
         tags = get_tags(item)
         text = item.text
-        if (tags[0] == 'T' and 'CR' not in tags[1:]):
-            text = re.sub(
-                r'([{cq}])\s*(\s|/)\s*([{oq}])'
-                .format(oq=OPENQUOTES,cq=CLOSEQUOTES),
-                r'\1 \2 \3', text, re.I|re.U
-            )
+        # basic_quoted_trans_re can't match without an opening quote or
+        # a comma, so don't bother running it on those lines
+        if (tags[0] == 'T' and 'CR' not in tags[1:]
+                and (',' in text or not OPENQUOTE_SET.isdisjoint(text))):
+            text = quote_sep_re.sub(r'\1 \2 \3', text)
             matches = [m for m in basic_quoted_trans_re.finditer(text)
                        if m.group('t').strip()]
             sub_items = []
@@ -494,7 +611,7 @@ def separate_secondary_translations(items):
                 for i, match in enumerate(matches):
                     start, end = match.start(), match.end()
                     t = match.group('t')
-                    if i == last_i and re.search(r'\w|\d', text[end:], re.U):
+                    if i == last_i and word_char_re.search(text, end):
                         t += text[match.end():]
                     pre = text[pos:match.start()]
                     # some instances have bad matches... try to avoid with
@@ -506,17 +623,18 @@ def separate_secondary_translations(items):
                         new_items.append(item)
                         break
                     new_tags = list(tags)
-                    if re.search(r'lit(?:eral(?:ly)?)?', pre):
+                    # the optional 'eral(ly)' can't affect whether
+                    # 'lit' matches, so a substring test is enough
+                    if 'lit' in pre:
                         if 'LT' not in new_tags: new_tags.append('LT')
-                    elif (re.search(r'(or|also|ii+|\b[bcd]\.)[ :,]', pre)
-                          or bare_T_seen):
+                    elif alt_trans_re.search(pre) or bare_T_seen:
                         if 'AL' not in new_tags: new_tags.append('AL')
                     else:
                         bare_T_seen = True
                     attrs = dict(item.attributes)
                     if match.group('judg'):
                         attrs['judgment'] = match.group('judg')
-                    if re.search(r'\w|\d', pre, re.U):
+                    if word_char_re.search(pre):
                         attrs['note'] = pre.strip()
                     attrs['tag'] = '+'.join(new_tags)
                     sub_items.append(Item(
@@ -605,52 +723,58 @@ def dewrap_lines(items):
     # look for patterns like L G L G and join them to L G
     # then look for T T and join them to T if they don't look like alternates
     unwrapped = []
-    used = set()
-    sig = []
-    for item in items:
-        tags = get_tags(item)
-        if tags[0] in ('L', 'G', 'T'):
-            sig.append(item.attributes['tag'])
-    sig = ' '.join(sig)
+    # used[i] is set once items[i] has been placed in unwrapped
+    used = bytearray(len(items))
+    alltags = [item.attributes.get('tag') for item in items]
+    sig = ' '.join(tag for tag in alltags
+                   if tag and tag.split('+', 1)[0] in ('L', 'G', 'T'))
     if (any(x in sig for x in ('L G L G ', 'L G T L G T', 'G G ', 'L L '))
         and not any(x in sig for x in ('L+', 'L-', 'G+', 'G-'))):
         # likely patterns for wrapping without other noise
-        ls = [item for item in items if item.attributes.get('tag') == 'L']
-        gs = [item for item in items if item.attributes.get('tag') == 'G']
-        for l_, g_ in zip_longest(ls, gs):
-            if l_ is not None and g_ is not None:
-                maxlen = max([len(l_.text), len(g_.text)])
-                l_.text = l_.text.ljust(maxlen)
-                g_.text = g_.text.ljust(maxlen)
+        l_idx = [i for i, tag in enumerate(alltags) if tag == 'L']
+        g_idx = [i for i, tag in enumerate(alltags) if tag == 'G']
+        ls = [items[i] for i in l_idx]
+        gs = [items[i] for i in g_idx]
+        # only paired lines get padded, so plain zip() is enough; and
+        # only the shorter line of each pair actually needs ljust()
+        for l_, g_ in zip(ls, gs):
+            llen, glen = len(l_.text), len(g_.text)
+            if llen < glen:
+                l_.text = l_.text.ljust(glen)
+            elif glen < llen:
+                g_.text = g_.text.ljust(llen)
         if ls:
             merge_items(*ls)
             unwrapped.append(ls[0])
         if gs:
             merge_items(*gs)
             unwrapped.append(gs[0])
-        used.update(id(x) for x in ls + gs)
+        for i in l_idx + g_idx:
+            used[i] = 1
     # add everything unused up to the first translation
-    for item in items:
-        if item.attributes.get('tag') in ('T', 'T+AC'):
+    # (merging L and G lines above doesn't change their tags)
+    for i, item in enumerate(items):
+        if alltags[i] in ('T', 'T+AC'):
             break
-        elif id(item) not in used:
+        elif not used[i]:
             unwrapped.append(item)
-            used.add(id(item))
+            used[i] = 1
     # now do translations
     if (any(x in sig for x in ('L G T L G T', 'T T+AC', 'T T+LN', 'T T'))
         and not any(x in sig for x in ('+EX', '+LT', '+AL', 'T+CR'))):
         # translations that appear wrapped and not alternates
-        ts = [item for item in items
-              if item.attributes.get('tag') in ('T', 'T+AC', 'T+LN')]
-        if ts:
+        t_idx = [i for i, tag in enumerate(alltags)
+                 if tag in ('T', 'T+AC', 'T+LN')]
+        if t_idx:
+            ts = [items[i] for i in t_idx]
             merge_items(*ts)
             unwrapped.append(ts[0])
-        used.update(id(x) for x in ts)
+        for i in t_idx:
+            used[i] = 1
     # finally add anything unused
-    for item in items:
-        if id(item) not in used:
+    for i, item in enumerate(items):
+        if not used[i]:
             unwrapped.append(item)
-            used.add(id(item))
     return unwrapped
 
 
@@ -658,12 +782,15 @@ def unquote_translations(items):
     for item in items:
         tags = get_tags(item)
         if tags[0] == 'T':
-            item.text = re.sub(
-                r'^\s*[{}]?'.format(OPENQUOTES), '', item.text, re.U
-            )
-            item.text = re.sub(
-                r'[{}]\s*$'.format(CLOSEQUOTES), '', item.text, re.U
-            )
+            # remove leading space and at most one opening quote
+            text = item.text.lstrip()
+            if text[:1] in OPENQUOTE_SET:
+                text = text[1:]
+            # remove a final closing quote and any space after it
+            stripped = text.rstrip()
+            if stripped[-1:] in CLOSEQUOTE_SET:
+                text = stripped[:-1]
+            item.text = text
 
     return items
 
@@ -684,6 +811,10 @@ def main(arglist=None):
         action='count', dest='verbosity', default=2,
         help='increase the verbosity (can be repeated: -vvv)'
     )
+    parser.add_argument('-j', '--jobs',
+        type=int, default=1,
+        help='number of infiles to normalize in parallel (default: 1)'
+    )
     parser.add_argument('infiles',
         nargs='*',
         help='the ODIN Xigt (XML) files to normalize'
@@ -695,16 +826,55 @@ def main(arglist=None):
 
 def run(args):
     if args.infiles:
-        for fn in args.infiles:
-            logging.info('Normalizing {}'.format(fn))
-            xc = xigtxml.load(fn, mode='full')
-            normalize_corpus(xc)
-            xigtxml.dump(fn, xc)
+        if args.jobs > 1 and len(args.infiles) > 1:
+            # files are independent, so each can go to its own process
+            with ProcessPoolExecutor(
+                    max_workers=args.jobs,
+                    initializer=_init_worker,
+                    initargs=(logging.getLogger().level,)) as pool:
+                # iterate the results so worker errors are raised here
+                for _ in pool.map(normalize_file, args.infiles):
+                    pass
+        else:
+            for fn in args.infiles:
+                normalize_file(fn)
     else:
-        xc = xigtxml.load(sys.stdin, mode='full')
-        normalize_corpus(xc)
+        xc = normalized_transient_corpus(
+            xigtxml.load(sys.stdin, mode='transient')
+        )
         print(xigtxml.dumps(xc))
 
 
+def _init_worker(level):
+    # normalize_file() reports progress with logging.info(); with the
+    # spawn start method (the default on Windows and macOS) a worker
+    # starts without the root logger set up by main(), so those
+    # messages would be dropped. Under fork the setup is inherited and
+    # basicConfig() does nothing.
+    logging.basicConfig(level=level)
+
+
+def normalize_file(fn):
+    logging.info('Normalizing %s', fn)
+    xc = normalized_transient_corpus(xigtxml.load(fn, mode='transient'))
+    xigtxml.dump(fn, xc)
+
+
+def normalized_transient_corpus(xc):
+    # IGTs are decoded, normalized, and encoded one at a time, so only
+    # the output XML (not the whole xigt model) is kept in memory. The
+    # input is fully read before dump() opens the file for writing.
+    return XigtCorpus(
+        id=xc.id,
+        type=xc.type,
+        attributes=xc.attributes,
+        metadata=xc.metadata,
+        igts=iter_normalized_igts(xc),
+        mode='transient',
+        namespace=xc.namespace,
+        nsmap=xc.nsmap
+    )
+
+
 if __name__ == '__main__':
     main()
@@ -3,13 +3,18 @@
 from __future__ import print_function
 
 import os
+import sys
 import re
 import argparse
 import logging
-from collections import defaultdict
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 
 
 buffer_size = 1000  # How many IGTs to cache before writing to the file
+max_cached = 10000  # How many IGTs to cache in total across all files
+max_open_files = 64  # How many output files to keep open between writes
+file_buffer = 1<<16  # Write buffer per open file (64 files: 4 MiB in all)
 default_split_key = '_ungrouped_'
 
 ### READING ODIN TEXT ##################################################
@@ -21,12 +26,15 @@ doc_re = re.compile(r'doc_id=(?P<doc_id>\S+) '
 
 def odin_blocks(lines):
     line_iterator = iter(lines)
+    # local names for what the per-line loops look up on every line
+    doc_match = doc_re.match
+    parse_line = odin_line
     for line in line_iterator:
-        doc = doc_re.match(line)
+        # most lines aren't headers; don't bother with the regex for them
+        doc = doc_match(line) if line.startswith('doc_id=') else None
         if doc is None:
             if 'doc_id=' in line:
-                logging.warning('Possible ODIN instance missed: {}'
-                                .format(line))
+                logging.warning('Possible ODIN instance missed: %s', line)
             continue
 
         header_lines = []
@@ -34,46 +42,47 @@ def odin_blocks(lines):
         iso639 = None
         odin_lines = []
 
-        try:
-            while line.strip() != '' and not line.startswith('line='):
-                header_lines.append(line.rstrip())
-                line = next(line_iterator)
+        # next() with a default instead of catching StopIteration; a
+        # block cut off by the end of the input is yielded as-is
+        while line.strip() != '' and not line.startswith('line='):
+            header_lines.append(line.rstrip())
+            line = next(line_iterator, None)
+            if line is None:
+                break
 
-            lang, iso639 = get_best_lang_match(header_lines)
+        if line is not None:
+            lang_lines, comments = parse_header(header_lines)
+            lang, iso639 = get_best_lang_match(lang_lines)
             log_comments(
                 doc.group('doc_id'), doc.group('linerange'),
-                header_lines
+                comments
             )
             if lang is None or iso639 is None:
                 logging.warning('Failed to get language or language code for '
-                                'document {}, lines {}.'
-                                .format(doc.group('doc_id'),
-                                        doc.group('linerange')))
+                                'document %s, lines %s.',
+                                doc.group('doc_id'), doc.group('linerange'))
             else:
-                logging.debug('Document {}, lines {}, Language: {}, '
-                              'ISO-639-3: {}'
-                              .format(doc.group('doc_id'),
-                                      doc.group('linerange'),
-                                      lang, iso639))
+                logging.debug('Document %s, lines %s, Language: %s, '
+                              'ISO-639-3: %s',
+                              doc.group('doc_id'), doc.group('linerange'),
+                              lang, iso639)
 
             while line.strip() != '':
-                odin_lines.append(odin_line(line))
-                line = next(line_iterator)
-
-        except StopIteration:
-            pass
-
-        finally:
-            yield {
-                'doc_id': doc.group('doc_id'),
-                'igt_id': doc.group('igt_id'),
-                'line_range': doc.group('linerange'),
-                'line_types': doc.group('linetypes'),
-                'language': lang,
-                'iso-639-3': iso639,
-                'lines': odin_lines,
-                'header_lines': header_lines
-            }
+                odin_lines.append(parse_line(line))
+                line = next(line_iterator, None)
+                if line is None:
+                    break
+
+        yield {
+            'doc_id': sys.intern(doc.group('doc_id')),
+            'igt_id': doc.group('igt_id'),
+            'line_range': doc.group('linerange'),
+            'line_types': doc.group('linetypes'),
+            'language': lang,
+            'iso-639-3': iso639,
+            'lines': odin_lines,
+            'header_lines': header_lines
+        }
 
 
 lang_chosen_re = re.compile(r'(?P<name>.*) \((?P<iso639>[^)]+)\)\s*$',
@@ -83,8 +92,32 @@ stage2_LN_re = re.compile(r'stage2_LN_lang_code: (?P<name>.*) '
 chosen_idx_re = re.compile(r'lang_chosen_idx=(?P<idx>[-0-9]+)')
 
 
-def get_best_lang_match(lines):
-    lang_lines = dict(l.split(':', 1) for l in lines if ':' in l)
+lang_keys = frozenset((
+    'language', 'stage3_lang_chosen', 'stage2_lang_chosen',
+    'stage2_LN_lang_code', 'lang_code', 'note'
+))
+
+
+comment_keys = frozenset(('comments', 'stage2_comment', 'not_an_IGT'))
+
+
+def parse_header(lines):
+    # one pass gets both the fields for get_best_lang_match() and the
+    # comments for log_comments(); like dict(), later lines with the
+    # same key replace earlier ones
+    lang_lines = {}
+    comments = []
+    for l in lines:
+        key, sep, val = l.partition(':')
+        if sep:
+            if key in lang_keys:
+                lang_lines[key] = val
+            elif key in comment_keys:
+                comments.append(l)
+    return lang_lines, comments
+
+
+def get_best_lang_match(lang_lines):
     # find best match
     match = None
     for key in ('language', 'stage3_lang_chosen', 'stage2_lang_chosen'):
@@ -104,42 +137,38 @@ def get_best_lang_match(lines):
                 if idx != -1:
                     langstring = lang_lines['lang_code'].split('||')[idx]
                     match = lang_chosen_re.match(langstring)
+    # language names and codes repeat across a corpus, so intern them
+    # to share one string per value among the cached IGTs
     if match:
-        return (match.group('name').strip().title(),
-                match.group('iso639').strip().lower())
+        return (sys.intern(match.group('name').strip().title()),
+                sys.intern(match.group('iso639').strip().lower()))
     else:
         return ('(Undetermined)', 'und')
 
 
-def log_comments(doc_id, linerange, lines):
-    comment_keys = ('comments', 'stage2_comment', 'not_an_IGT')
-    comments = [
-        line for line in lines
-        if ':' in line and line.split(':', 1)[0] in comment_keys
-    ]
+def log_comments(doc_id, linerange, comments):
     if comments:
         logging.info(
-            'doc_id={} lines={} has annotator comments:\n'
-            .format(doc_id, linerange) +
-            '  ' + '\n  '.join(comments)
+            'doc_id=%s lines=%s has annotator comments:\n  %s',
+            doc_id, linerange, '\n  '.join(comments)
         )
 
 
-line_re = re.compile(r'line=(?P<line>\d+) tag=(?P<tag>[^:]+):(?P<content>.*)')
-
-
 def odin_line(line):
-    match = line_re.match(line)
-    if match:
-        return {
-            'line': match.group('line'),
-            'tag': match.group('tag'),
-            'content': match.group('content')
-        }
-    else:
-        logging.warning('Non-empty IGT line could not be parsed:\n{}'
-                        .format(line))
-        return {}
+    # plain string ops that parse the same as matching the regex
+    #   line=(?P<line>\d+) tag=(?P<tag>[^:]+):(?P<content>.*)
+    # (\d matches exactly the characters str.isdecimal() accepts)
+    if line.startswith('line='):
+        head, colon, content = line.partition(':')
+        linenum, sep, tag = head[5:].partition(' tag=')
+        if colon and sep and tag and linenum.isdecimal():
+            return {
+                'line': linenum,
+                'tag': sys.intern(tag),
+                'content': content.partition('\n')[0]  # . doesn't match \n
+            }
+    logging.warning('Non-empty IGT line could not be parsed:\n%s', line)
+    return {}
 
 
 ## ============================================= ##
@@ -182,6 +211,10 @@ def main(arglist=None):
         choices=('doc_id', 'iso-639-3'), default='doc_id',
         help='group IGTs by their doc_id|language'
     )
+    parser.add_argument('-j', '--jobs',
+        type=int, default=1,
+        help='number of worker processes for parsing the input'
+    )
     parser.add_argument('outdir', help='the directory for output files')
     parser.add_argument('infiles',
         nargs='*',
@@ -199,11 +232,27 @@ class _BufferedIGTWriter(object):
     """
     def __init__(self, outdir):
         self.outdir = outdir
-        self.cache = defaultdict(list)
+        # groups are kept in the order they were started; the oldest is
+        # flushed when too many IGTs are cached in total. Don't reorder
+        # on write: keys that differ only by ':' vs '-' share a file, and
+        # flush() must visit them in the same order as without the cap
+        self.cache = OrderedDict()
+        self.cached = 0
+        # recently written files are kept open, least recent first
+        self.files = OrderedDict()
     def write(self, key, igt):
-        self.cache[key].append(igt)
-        if len(self.cache[key]) >= buffer_size:
+        self.write_formatted(key, format_odin_igt(igt))
+    def write_formatted(self, key, text):
+        # text is an IGT already formatted with format_odin_igt()
+        igts = self.cache.get(key)
+        if igts is None:
+            igts = self.cache[key] = []
+        igts.append(text)
+        self.cached += 1
+        if len(igts) >= buffer_size:
             self.flush(key)
+        elif self.cached > max_cached:
+            self.flush(next(iter(self.cache)))
     def flush(self, key=None):
         if key is None:
             keys = list(self.cache.keys())
@@ -211,26 +260,51 @@ class _BufferedIGTWriter(object):
             keys = [key]
         for key in keys:
             path = key.replace(':', '-') + '.txt'
-            with open(os.path.join(self.outdir, path), 'a') as f:
-                for igt in self.cache[key]:
-                    print(format_odin_igt(igt), file=f, end='\n\n')
-            del self.cache[key]
+            # join the whole batch first so it goes out in one write
+            payload = ''.join(text + '\n\n' for text in self.cache[key])
+            self._file(path).write(payload)
+            self.cached -= len(self.cache.pop(key))
+    def _file(self, path):
+        # files are keyed by path, not group key, since different keys
+        # can map to the same file
+        f = self.files.get(path)
+        if f is None:
+            if len(self.files) >= max_open_files:
+                self.files.popitem(last=False)[1].close()
+            # flush() already writes one payload per group, so only a
+            # modest buffer is needed to coalesce small groups
+            f = open(os.path.join(self.outdir, path), 'a',
+                     buffering=file_buffer)
+            self.files[path] = f
+        else:
+            self.files.move_to_end(path)
+        return f
+    def close(self):
+        # does not flush; cached IGTs are only written by flush()
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
 
 
 def format_odin_igt(igt):
+    doc_id = igt['doc_id']
+    line_range = igt['line_range']
+    line_types = igt['line_types']
     # now choose top line based on existence of igt_id field
     if 'igt_id' in igt:
-        top = 'doc_id={doc_id} igt_id={igt_id} {line_range} {line_types}'
+        top = (f"doc_id={doc_id} igt_id={igt['igt_id']} "
+               f'{line_range} {line_types}')
     else:
-        top = 'doc_id={doc_id} {line_range} {line_types}'
-    lang_line = 'language: {language} ({iso-639-3})'
-    line = 'line={line} tag={tag}:{content}'
-    lines = [top.format(**igt), lang_line.format(**igt)]
+        top = f'doc_id={doc_id} {line_range} {line_types}'
+    lines = [top, f"language: {igt['language']} ({igt['iso-639-3']})"]
     for hl in igt['header_lines']:
         if not hl.startswith('language:'):  # don't put language line twice
             lines.append(hl)
     for linedata in igt['lines']:
-        lines.append(line.format(**linedata))
+        lines.append(
+            f"line={linedata['line']} tag={linedata['tag']}:"
+            f"{linedata['content']}"
+        )
     return '\n'.join(lines)
 
 
@@ -238,18 +312,104 @@ def run(args):
     if not os.path.exists(args.outdir):
         os.mkdir(args.outdir)  # raises OSError, e.g., if dir exists
     writer = _BufferedIGTWriter(args.outdir)
-    # either go through all files or just read from stdin
+    try:
+        # either go through all files or just read from stdin
+        if args.jobs > 1:
+            process_parallel(writer, args)
+        elif args.infiles:
+            for fn in args.infiles:
+                with open(fn, 'r', buffering=1<<20) as f:
+                    process(f, writer, args)
+        else:
+            process(sys.stdin, writer, args)
+        writer.flush()
+    finally:
+        writer.close()
+
+
+def process_parallel(writer, args):
+    # chunks of at most buffer_size IGTs are parsed and formatted in
+    # worker processes; at most 2 chunks per worker are in flight and
+    # the results are written in submission order, so memory stays
+    # bounded and the output matches a sequential run
+    pending = deque()
+    with ProcessPoolExecutor(
+            max_workers=args.jobs,
+            initializer=_init_worker,
+            initargs=(logging.getLogger().level,)) as pool:
+        for f in _input_files(args):
+            for lines, first in igt_chunks(f, buffer_size):
+                if len(pending) >= 2 * args.jobs:
+                    _write_chunk(writer, pending.popleft().result())
+                pending.append(pool.submit(_parse_chunk, lines, first, args))
+        while pending:
+            _write_chunk(writer, pending.popleft().result())
+
+
+def _input_files(args):
     if args.infiles:
         for fn in args.infiles:
-            with open(fn, 'r') as f:
-                process(f, writer, args)
+            with open(fn, 'r', buffering=1<<20) as f:
+                yield f
     else:
-        process(sys.stdin, writer, args)
-    writer.flush()
+        yield sys.stdin
+
+
+def _init_worker(level):
+    # workers log the reader's warnings about unparsed lines; with the
+    # spawn start method (the default on Windows and macOS) they start
+    # without the root logger set up by main(), so the -v level would be
+    # lost. Under fork the setup is inherited and this does nothing.
+    logging.basicConfig(level=level)
+
+
+def _parse_chunk(lines, first, args):
+    return [
+        (key, format_odin_igt(igt))
+        for key, igt in keyed_igts(lines, args, first=first)
+    ]
+
+
+def _write_chunk(writer, formatted):
+    for key, text in formatted:
+        writer.write_formatted(key, text)
+
+
+def igt_chunks(lines, size):
+    # split lines into runs of at most size IGTs, yielding each run
+    # with the index of its first IGT in the whole input; runs are only
+    # cut before an IGT's doc_id= line and outside of any block (as
+    # odin_blocks() sees them), so each parses the same on its own
+    chunk = []
+    first = 0
+    count = 0
+    in_block = False
+    for line in lines:
+        if in_block:
+            # odin_blocks() ends a block at the first blank line
+            if line.strip() == '':
+                in_block = False
+        elif line.startswith('doc_id=') and doc_re.match(line):
+            if count >= size:
+                yield chunk, first
+                chunk = []
+                first += count
+                count = 0
+            in_block = True
+            count += 1
+        chunk.append(line)
+    if chunk:
+        yield chunk, first
 
 
 def process(f, writer, args):
-    for i, igt in enumerate(odin_blocks(f)):
+    for key, igt in keyed_igts(f, args):
+        writer.write(key, igt)
+
+
+def keyed_igts(f, args, first=0):
+    # first is the index of f's first IGT, e.g., for a chunk of a file
+    for i, igt in enumerate(odin_blocks(f), first):
         if args.assign_igt_ids:
             igt['igt_id'] = 'igt{}-{}'.format(
                 igt['doc_id'],
@@ -258,7 +418,7 @@ def process(f, writer, args):
         if args.igt_meta == 'discard':
             igt['header_lines'] = []
         key = igt.get(args.split_by, default_split_key)
-        writer.write(key, igt)
+        yield key, igt
 
 
 if __name__ == '__main__':
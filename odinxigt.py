@@ -1,23 +1,36 @@
 
 # common operations for odinclean and odinnormalize
 
-import re
-
 from xigt import Item
 
 PRITAGS = ('L','G','T','L-G','L-T','G-T','L-G-T','M','B','C')
 SECTAGS = ('AC','AL','CN','CR','DB','EX','LN','LT','SY')
 
 def copy_items(items):
-    return [
-        Item(id=item.id, type=item.type,
-             attributes=item.attributes, text=item.text)
-        for item in items
-    ]
+    return [_copy_item(item) for item in items]
+
+def _copy_item(item):
+    # Same result as Item(id=..., type=..., attributes=..., text=...)
+    # but skips the mixin __init__ chain; the attributes dict is copied
+    # so changes to the copies (e.g. new tags) don't leak back into the
+    # original tier. Keep in sync with xigt's Item.__init__.
+    new = Item.__new__(Item)
+    new.id = item.id
+    new.type = item.type
+    new.attributes = dict(item.attributes)
+    new.namespace = None
+    new.nsmap = None
+    new._parent = None
+    new.text = item.text
+    return new
 
 def get_tags(item):
     return item.attributes.get('tag', '').split('+')
 
+def first_tag(item):
+    # same as get_tags(item)[0] without building the list
+    return item.attributes.get('tag', '').partition('+')[0]
+
 def remove_blank_items(items):
     return [
         i for i in items
@@ -30,18 +43,29 @@ def min_indent(items, tags=None):
     tags = set(tags).difference(['M','B'])
     indents = []
     for item in items:
-        tag = get_tags(item)[0]
+        tag = first_tag(item)
         if tag in tags:
-            indents.append(re.match(r'\s*', item.text, re.U).end())
+            # str.lstrip() strips the same characters as \s
+            text = item.text
+            indents.append(len(text) - len(text.lstrip()))
     return min(indents or [0])
 
 def shift_left(items, tags=None):
     if tags is None: tags = PRITAGS
     tags = set(tags).difference(['M','B'])
-    maxshift = min_indent(items, tags)
-
+    # one pass to get each item's tag and the minimum indent (as in
+    # min_indent()), then shift using the recorded tags
+    tagged = []
+    indents = []
     for item in items:
-        tag = get_tags(item)[0]
+        tag = first_tag(item)
+        if tag in tags:
+            text = item.text
+            indents.append(len(text) - len(text.lstrip()))
+        tagged.append((item, tag))
+    maxshift = min(indents or [0])
+
+    for item, tag in tagged:
         if tag == 'M':
             item.text = item.text.strip()
         elif tag in tags:
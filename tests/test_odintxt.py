@@ -0,0 +1,93 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import odintxt
+
+
+def make_igt(doc_id, start, lang, iso639):
+    return (
+        'doc_id={0} {1} {2} L G T\n'
+        'language: {3} ({4})\n'
+        'line={1} tag=L:  ni  ga\n'
+        'line={5} tag=G:  1SG NOM\n'
+        'line={2} tag=T:  "I am"\n'
+        '\n'
+    ).format(doc_id, start, start + 2, lang, iso639, start + 1)
+
+
+def write_inputs(tmpdir):
+    langs = [('German', 'deu'), ('Dutch', 'nld'), ('Ewe', 'ewe')]
+    paths = []
+    for d in range(4):
+        doc_id = str(d + 1)
+        path = os.path.join(str(tmpdir), doc_id + '.txt')
+        with open(path, 'w') as f:
+            for i in range(25):
+                lang, iso639 = langs[(d + i) % len(langs)]
+                f.write(make_igt(doc_id, i * 5 + 1, lang, iso639))
+                if i % 10 == 3:
+                    f.write('junk doc_id= missed line\n\n')
+        paths.append(path)
+    return paths
+
+
+def read_tree(outdir):
+    tree = {}
+    for fn in sorted(os.listdir(outdir)):
+        with open(os.path.join(outdir, fn)) as f:
+            tree[fn] = f.read()
+    return tree
+
+
+def test_igt_chunks_parse_like_whole_input(tmpdir):
+    class args:
+        assign_igt_ids = True
+        first_id = 1
+        igt_meta = 'keep'
+        split_by = 'doc_id'
+    with open(write_inputs(tmpdir)[0]) as f:
+        lines = f.readlines()
+    whole = list(odintxt.keyed_igts(lines, args))
+    for size in (1, 4, 1000):
+        parts = []
+        for chunk, first in odintxt.igt_chunks(lines, size):
+            parts.extend(odintxt.keyed_igts(chunk, args, first=first))
+        assert parts == whole
+
+
+def test_jobs_output_matches_serial(tmpdir, monkeypatch):
+    infiles = write_inputs(tmpdir.mkdir('in'))
+    # small chunks and groups so the parallel run splits files and
+    # flushes often
+    monkeypatch.setattr(odintxt, 'buffer_size', 4)
+    for opts in (['--assign-igt-ids'],
+                 ['-m', 'keep', '--split-by', 'iso-639-3']):
+        serial = str(tmpdir.join('serial' + opts[-1]))
+        parallel = str(tmpdir.join('parallel' + opts[-1]))
+        odintxt.main(opts + [serial] + infiles)
+        odintxt.main(['-j', '3'] + opts + [parallel] + infiles)
+        assert read_tree(serial) == read_tree(parallel)
+
+
+def test_writer_keeps_order_for_keys_sharing_a_file(tmpdir, monkeypatch):
+    # 'a:b' and 'a-b' are both written to a-b.txt
+    def run(writes):
+        outdir = str(tmpdir.mkdir('out{}'.format(len(tmpdir.listdir()))))
+        writer = odintxt._BufferedIGTWriter(outdir)
+        for key, text in writes:
+            writer.write_formatted(key, text)
+        writer.flush()
+        writer.close()
+        with open(os.path.join(outdir, 'a-b.txt')) as f:
+            return f.read().split()
+
+    # below the cap, groups are flushed in the order they were started
+    assert run([('a:b', 'x1'), ('a-b', 'y1'), ('a:b', 'x2')]) == \
+        ['x1', 'x2', 'y1']
+    # over the cap, the oldest group is flushed first
+    monkeypatch.setattr(odintxt, 'max_cached', 3)
+    writes = [('a:b', 'x1'), ('a-b', 'y1'), ('a:b', 'x2'),
+              ('a-b', 'y2'), ('a:b', 'x3'), ('a-b', 'y3')]
+    assert run(writes) == ['x1', 'x2', 'y1', 'y2', 'y3', 'x3']